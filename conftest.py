@@ -1,8 +1,55 @@
 """Pytest configuration for Music_Split project"""
+import asyncio
+import os
 import sys
+import tempfile
 from pathlib import Path
 
+import pytest
+
 # Add project root to Python path
 project_root = Path(__file__).parent
 sys.path.insert(0, str(project_root))
 
+# Under pytest-xdist, give each worker its own sessions dir so tests that
+# wipe TEMP_DIR (/cleanup-all) cannot race with another worker's files.
+# Must run before src.api is imported (TEMP_DIR is resolved at import time).
+_xdist_worker = os.environ.get("PYTEST_XDIST_WORKER")
+if _xdist_worker:
+    os.environ.setdefault(
+        "SESSIONS_DIR", str(Path(tempfile.gettempdir()) / f"music-separator-{_xdist_worker}")
+    )
+    # Split the cores between workers so native thread pools (OpenMP/BLAS) don't
+    # oversubscribe. torch itself is pinned to 1 thread by src.separator.
+    _threads = str(max(1, (os.cpu_count() or 1) // int(os.environ.get("PYTEST_XDIST_WORKER_COUNT", "1"))))
+    for _var in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS"):
+        os.environ.setdefault(_var, _threads)
+
+
+@pytest.fixture(scope="session")
+def event_loop():
+    """Session-wide event loop so async fixtures (API client) can be session-scoped.
+
+    Defined here rather than in a test module: pytest-asyncio closes the current
+    loop whenever another module sets up its own event_loop.
+    """
+    loop = asyncio.new_event_loop()
+    yield loop
+    loop.close()
+
+
+def pytest_collection_modifyitems(config, items):
+    """Skip gpu-marked tests when CUDA is unavailable (torch only probed if needed)"""
+    gpu_items = [item for item in items if "gpu" in item.keywords]
+    if not gpu_items:
+        return
+    try:
+        import torch
+        has_cuda = torch.cuda.is_available()
+    except Exception:
+        has_cuda = False
+    if has_cuda:
+        return
+    skip_gpu = pytest.mark.skip(reason="requires CUDA (no GPU on this runner)")
+    for item in gpu_items:
+        item.add_marker(skip_gpu)
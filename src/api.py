@@ -4,17 +4,20 @@ WITH: Monitoring, Structured Logging, Resilience Patterns
 """
 from fastapi import FastAPI, File, UploadFile, HTTPException, Form, Request, Response
 from pydantic import BaseModel, Field
-from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse
+from fastapi.responses import FileResponse, JSONResponse, PlainTextResponse, StreamingResponse
 from fastapi.middleware.cors import CORSMiddleware
 from pathlib import Path
 import uuid
+import urllib.parse
 import asyncio
+import functools
+import json
 import multiprocessing
 try:
     multiprocessing.set_start_method('spawn', force=True)
 except RuntimeError:
     pass
-from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from contextlib import asynccontextmanager
 from typing import Dict, Optional, Any
 try:
@@ -25,15 +28,15 @@ try:
     from opentelemetry import trace as otel_trace
 except Exception:
     otel_trace = None
+import numpy as np
 import soundfile as sf
+import aiofiles
 import tempfile
 import shutil
 import time
 from datetime import datetime
 import threading
 import os
-import threading
-import os
 from contextlib import contextmanager  # kept for potential future use (no pika import)
 import yt_dlp
 import subprocess
@@ -72,29 +75,54 @@ _metrics_stop_event = threading.Event()
 _metrics_thread: Optional[threading.Thread] = None
 _METRICS_INTERVAL = int(os.environ.get("METRICS_PUBLISH_INTERVAL", "15"))
 
-import json
-from pathlib import Path
-
 
-# Process pool for CPU-bound separation tasks — created at lifespan startup
+# Process pool for CPU-bound separation tasks — created lazily on first job
 _process_pool: Optional[ProcessPoolExecutor] = None
+# Guards check-and-create/swap: called from the event loop and from future-callback threads
+_process_pool_lock = threading.RLock()
 _PROCESS_POOL_MAX_WORKERS = int(os.environ.get("PROCESS_POOL_WORKERS", "1")) # Force 1 worker for stability
+_CLEANUP_INTERVAL = int(os.environ.get("CLEANUP_INTERVAL", "300"))
+
+def get_process_pool() -> Optional[ProcessPoolExecutor]:
+    """Return the shared process pool, creating it on first use (None if it can't start)."""
+    global _process_pool
+    if _process_pool is not None:
+        return _process_pool
+    with _process_pool_lock:
+        if _process_pool is None:
+            try:
+                # CRITICAL: spawn context for CUDA compatibility (fork doesn't work with CUDA)
+                _process_pool = ProcessPoolExecutor(
+                    max_workers=_PROCESS_POOL_MAX_WORKERS,
+                    mp_context=multiprocessing.get_context("spawn"),
+                )
+                logger.info(f"ProcessPoolExecutor started with {_PROCESS_POOL_MAX_WORKERS} workers (spawn method)")
+                try:
+                    process_pool_workers.set(_PROCESS_POOL_MAX_WORKERS)
+                except Exception:
+                    pass
+            except Exception as e:
+                logger.error(f"Could not start process pool: {e}")
+                _process_pool = None
+        return _process_pool
 
 def _restart_process_pool():
     """Restarts the process pool if it's broken."""
     global _process_pool
     logger.warning("♻️ Restarting Process Pool...")
-    try:
-        if _process_pool:
-            _process_pool.shutdown(wait=False)
-    except Exception:
-        pass
-    
-    try:
-        _process_pool = ProcessPoolExecutor(max_workers=_PROCESS_POOL_MAX_WORKERS)
+    with _process_pool_lock:
+        try:
+            if _process_pool:
+                _process_pool.shutdown(wait=False)
+        except Exception:
+            pass
+        
+        _process_pool = None
+        pool = get_process_pool()
+    if pool is not None:
         logger.info("✅ Process Pool Restarted")
-    except Exception as e:
-        logger.error(f"❌ Failed to restart process pool: {e}")
+    else:
+        logger.error("❌ Failed to restart process pool")
 
 MAX_PENDING = int(os.environ.get("MAX_PENDING", "4"))
 MAX_DURATION_SECONDS = int(os.environ.get("MAX_DURATION_SECONDS", "600"))
@@ -102,7 +130,7 @@ MAX_DURATION_SECONDS = int(os.environ.get("MAX_DURATION_SECONDS", "600"))
 
 # ✅ Import stems config
 from src.stems import STEM_CONFIGS
-from src.separator import get_separator, clear_cache, MusicSeparator, get_best_device
+from src.separator import get_separator, clear_cache, MusicSeparator, get_best_device, STEMS_MANIFEST
 
 # ✅ Import monitoring and resilience
 from src.metrics import (
@@ -171,6 +199,7 @@ def _worker_separate(model_name: str, input_path: str, output_dir: str, device:
 def cleanup_old_sessions(max_age_seconds: int = 3600, max_to_check: int = 50):
     """
     Clean up old session directories (limited to prevent slowdown).
+    Sessions of pending/running jobs are never removed, whatever their age.
     
     Args:
         max_age_seconds: Delete sessions older than this (default 1 hour)
@@ -180,25 +209,35 @@ def cleanup_old_sessions(max_age_seconds: int = 3600, max_to_check: int = 50):
         Number of sessions cleaned
     """
     try:
-        sessions = list(TEMP_DIR.iterdir())
+        # One scandir pass: is_dir() comes from d_type, stat() is done once per entry
+        with os.scandir(TEMP_DIR) as it:
+            sessions = [
+                (entry.stat(follow_symlinks=False).st_mtime, entry)
+                for entry in it
+                if entry.is_dir(follow_symlinks=False)
+            ]
         # Sort by modification time, oldest first
-        sessions.sort(key=lambda p: p.stat().st_mtime if p.is_dir() else 0)
+        sessions.sort(key=lambda s: s[0])
+        candidates = sessions[:max_to_check]
         
-        cleaned = 0
-        checked = 0
-        now = time.time()
+        # Single pass partition against a cutoff computed once
+        cutoff = time.time() - max_age_seconds
+        active_sessions = JOBS.active_session_ids()
+        stale = [
+            entry.path for mtime, entry in candidates
+            if mtime < cutoff and entry.name not in active_sessions
+        ]
         
-        for session_dir in sessions:
-            if checked >= max_to_check:
-                break
-            
-            if session_dir.is_dir():
-                checked += 1
-                age_seconds = now - session_dir.stat().st_mtime
-                if age_seconds > max_age_seconds:
-                    shutil.rmtree(session_dir, ignore_errors=True)
-                    cleaned += 1
-                    logger.debug(f"Cleaned up old session: {session_dir.name}")
+        if len(stale) > 1:
+            # rmtree is syscall-bound (unlink): a few threads overlap the removals
+            workers = min(8, len(stale), os.cpu_count() or 1)
+            with ThreadPoolExecutor(max_workers=workers) as ex:
+                list(ex.map(functools.partial(shutil.rmtree, ignore_errors=True), stale))
+        elif stale:
+            shutil.rmtree(stale[0], ignore_errors=True)
+        
+        cleaned = len(stale)
+        checked = len(candidates)
         
         if cleaned > 0:
             logger.info(f"Cleanup removed {cleaned} old sessions (checked {checked})")
@@ -224,8 +263,23 @@ def _commit_modal_volume():
         logger.warning(f"⚠️ Failed to commit Modal volume: {e}")
 
 
+# Dev/E2E only: accepte des URLs file:// à la place de YouTube (pas de yt-dlp ni réseau)
+ALLOW_LOCAL_MEDIA_URLS = os.environ.get("ALLOW_LOCAL_MEDIA_URLS", "").lower() in ("1", "true", "yes")
+
+
 def download_youtube_audio(url: str, output_dir: Path) -> Path:
     """Downloads audio from YouTube URL to output_dir/input.wav"""
+
+    if url.startswith("file://"):
+        if not ALLOW_LOCAL_MEDIA_URLS:
+            raise ValueError("file:// URLs are disabled (set ALLOW_LOCAL_MEDIA_URLS=1 for local testing)")
+        # Court-circuit yt-dlp: ré-encode le fichier local en WAV comme le ferait le postprocessor
+        source = Path(urllib.parse.unquote(urllib.parse.urlparse(url).path))
+        audio, sr = sf.read(str(source), dtype="float32", always_2d=True)
+        target = output_dir / "input.wav"
+        sf.write(str(target), audio, sr, subtype="PCM_16")
+        logger.info(f"📁 Using local media instead of YouTube: {source}")
+        return target
     
     # Configuration yt-dlp optimisée pour éviter les blocages
     ydl_opts = {
@@ -270,13 +324,15 @@ def download_youtube_audio(url: str, output_dir: Path) -> Path:
 setup_logging(level="INFO", json_format=True)
 logger = get_logger(__name__)
 
-import json
-from pathlib import Path
+ACTIVE_JOB_STATUSES = ("pending", "running")
+
 
 class JobManager:
     def __init__(self, persistence_dir: Optional[str] = None):
         self.persistence_dir = Path(persistence_dir) if persistence_dir else None
         self._memory_jobs = {}
+        # Ids of pending/running jobs, maintained on every write (O(1) active count)
+        self._active_ids = set()
         if self.persistence_dir:
             self.persistence_dir.mkdir(parents=True, exist_ok=True)
             logger.info(f"JobManager using persistence dir: {self.persistence_dir}")
@@ -314,6 +370,27 @@ class JobManager:
                 logger.error(f"Failed to save job {job_id}: {e}")
         
         self._memory_jobs[job_id] = data
+        if data.get("status") in ACTIVE_JOB_STATUSES:
+            self._active_ids.add(job_id)
+        else:
+            self._active_ids.discard(job_id)
+
+    def __delitem__(self, job_id: str):
+        del self._memory_jobs[job_id]
+        self._active_ids.discard(job_id)
+        if self.persistence_dir:
+            self._get_file_path(job_id).unlink(missing_ok=True)
+
+    @property
+    def active_count(self) -> int:
+        """Number of pending/running jobs"""
+        return len(self._active_ids)
+
+    def active_session_ids(self) -> set:
+        """Session dirs used by pending/running jobs (must survive cleanup)"""
+        # Snapshot: job callbacks update _active_ids from other threads
+        jobs = (self._memory_jobs.get(job_id) for job_id in tuple(self._active_ids))
+        return {job["session_id"] for job in jobs if job and job.get("session_id")}
 
     def get(self, job_id: str, default=None):
         try:
@@ -378,11 +455,22 @@ from fastapi.middleware.gzip import GZipMiddleware
 app.add_middleware(GZipMiddleware, minimum_size=1000)
 
 # Dossier temporaire pour les résultats
-# Use /data/sessions for persistent storage on Modal (mounted volume)
-# Falls back to /tmp/music-separator for local development
-TEMP_DIR = Path(os.environ.get("SESSIONS_DIR", "/data/sessions")) if os.environ.get("JOBS_DIR") else Path("/tmp/music-separator")
+# SESSIONS_DIR always wins when set (Modal volume, per-worker test dirs)
+# Otherwise /data/sessions on Modal (JOBS_DIR set), /tmp/music-separator locally
+if os.environ.get("SESSIONS_DIR"):
+    TEMP_DIR = Path(os.environ["SESSIONS_DIR"])
+elif os.environ.get("JOBS_DIR"):
+    TEMP_DIR = Path("/data/sessions")
+else:
+    TEMP_DIR = Path("/tmp/music-separator")
 TEMP_DIR.mkdir(exist_ok=True, parents=True)
 
+# Téléchargements délégués au reverse proxy (nginx X-Accel-Redirect, sendfile zéro-copie)
+# Le proxy doit exposer TEMP_DIR en location interne, par ex.:
+#   location /_internal_sessions/ { internal; alias /tmp/music-separator/; }
+USE_XACCEL = os.environ.get("USE_XACCEL", "").lower() in ("1", "true", "yes")
+XACCEL_PREFIX = os.environ.get("XACCEL_PREFIX", "/_internal_sessions").rstrip("/")
+
 
 # ============================================================
 # MIDDLEWARE
@@ -545,7 +633,7 @@ def get_models():
     return {
         "models": list(models_info.keys()),
         "total": len(models_info),
-        "details": models_info
+        "details": {name: dict(info) for name, info in models_info.items()}
     }
 
 
@@ -555,7 +643,7 @@ def get_model_info(model_name: str):
     try:
         info = MusicSeparator.get_model_info(model_name)
         logger.info(f"Model info requested: {model_name}")
-        return info
+        return dict(info)
     except ValueError as e:
         logger.warning(f"Model not found: {model_name}")
         raise HTTPException(status_code=404, detail=str(e))
@@ -687,7 +775,7 @@ async def separate_audio(
         now_ts = time.time()
 
         # Local Pool Fallback
-        if _process_pool is None:
+        if get_process_pool() is None:
              raise HTTPException(status_code=503, detail="Backend unavailable")
 
         job_id = uuid.uuid4().hex
@@ -745,10 +833,8 @@ async def separate_audio(
         JOBS[job_id] = job
         
         # Check if process pool is available
-        if _process_pool is None:
-             _restart_process_pool()
-             
-        if _process_pool is None:
+        pool = get_process_pool()
+        if pool is None:
             job["status"] = "error"
             job["error"] = "Process pool not initialized"
             JOBS[job_id] = job
@@ -761,13 +847,14 @@ async def separate_audio(
         except: pass
         
         try:
-            future = _process_pool.submit(_worker_separate, separation_model, str(input_file), str(output_dir), SELECTED_DEVICE)
+            future = pool.submit(_worker_separate, separation_model, str(input_file), str(output_dir), SELECTED_DEVICE)
         except Exception as e:
             if "process pool is not usable" in str(e).lower() or "brokenprocesspool" in str(e).lower():
                 logger.warning("⚠️ Pool broken during submission. Restarting and retrying...")
                 _restart_process_pool()
-                if _process_pool:
-                    future = _process_pool.submit(_worker_separate, separation_model, str(input_file), str(output_dir), SELECTED_DEVICE)
+                pool = get_process_pool()
+                if pool:
+                    future = pool.submit(_worker_separate, separation_model, str(input_file), str(output_dir), SELECTED_DEVICE)
                 else:
                     raise HTTPException(status_code=503, detail="Backend unavailable after restart")
             else:
@@ -870,8 +957,7 @@ async def separate_youtube(request: Request, yt_req: YouTubeRequest):
     temp_path = TEMP_DIR / f"tmp{uuid.uuid4().hex[:12]}"
     temp_path.mkdir(parents=True, exist_ok=True)
     
-    # Cleanup old sessions (limited to prevent slowdown)
-    # cleanup_old_sessions(max_age_seconds=3600, max_to_check=20)
+    # Old sessions are swept by the background cleanup task (see lifespan)
     
     output_dir = temp_path / "output"
     output_dir.mkdir(exist_ok=True)
@@ -888,7 +974,7 @@ async def separate_youtube(request: Request, yt_req: YouTubeRequest):
         now_ts = time.time()
         
         # Local Pool Fallback
-        if _process_pool is None:
+        if get_process_pool() is None:
              raise HTTPException(status_code=503, detail="Backend unavailable")
 
         job_id = uuid.uuid4().hex
@@ -968,11 +1054,8 @@ async def separate_youtube(request: Request, yt_req: YouTubeRequest):
         JOBS[job_id] = job
         
         # Check if process pool is available
-        # Check if process pool is available
-        if _process_pool is None:
-             _restart_process_pool()
-             
-        if _process_pool is None:
+        pool = get_process_pool()
+        if pool is None:
             job["status"] = "error"
             job["error"] = "Process pool not initialized"
             JOBS[job_id] = job
@@ -985,13 +1068,14 @@ async def separate_youtube(request: Request, yt_req: YouTubeRequest):
         except: pass
         
         try:
-            future = _process_pool.submit(_worker_separate, yt_req.model_name, str(input_file), str(output_dir), SELECTED_DEVICE)
+            future = pool.submit(_worker_separate, yt_req.model_name, str(input_file), str(output_dir), SELECTED_DEVICE)
         except Exception as e:
             if "process pool is not usable" in str(e).lower() or "brokenprocesspool" in str(e).lower():
                 logger.warning("⚠️ Pool broken during submission (YouTube). Restarting and retrying...")
                 _restart_process_pool()
-                if _process_pool:
-                     future = _process_pool.submit(_worker_separate, yt_req.model_name, str(input_file), str(output_dir), SELECTED_DEVICE)
+                pool = get_process_pool()
+                if pool:
+                     future = pool.submit(_worker_separate, yt_req.model_name, str(input_file), str(output_dir), SELECTED_DEVICE)
                 else:
                     raise HTTPException(status_code=503, detail="Backend unavailable after restart")
             else:
@@ -1028,6 +1112,27 @@ class MixRequest(BaseModel):
     session_id: str
     stems: Dict[str, float]  # stem_name -> volume (0.0 to 1.0)
 
+# Taille des blocs (en frames) lus par /mix: 16384 x 2 x float32 = 128 Ko
+_MIX_BLOCK_FRAMES = 16384
+
+
+@functools.lru_cache(maxsize=512)
+def _stem_manifest(output_dir: str) -> Dict[str, str]:
+    """Read (once per session) the stem → filename mapping written by the separator."""
+    with open(Path(output_dir) / STEMS_MANIFEST) as f:
+        return json.load(f)
+
+
+def _resolve_stem_path(output_dir: Path, stem: str) -> Path:
+    """Path of a stem file, from the session manifest when there is one."""
+    try:
+        filename = _stem_manifest(str(output_dir)).get(stem, f"{stem}.flac")
+    except (OSError, ValueError):
+        # Pas encore de manifeste (job en cours, anciennes sessions): nom par défaut
+        filename = f"{stem}.flac"
+    return output_dir / filename
+
+
 @app.post("/mix")
 def mix_stems(req: MixRequest):
     """
@@ -1037,48 +1142,58 @@ def mix_stems(req: MixRequest):
     if not session_path.exists():
         raise HTTPException(status_code=404, detail="Session not found")
 
-    # Load and mix
-    mixed_audio = None
-    sr = 44100
-    
-    import numpy as np
-    
     try:
+        # Stems sélectionnés et présents, avec leur en-tête (sf.info ne décode rien)
+        selected = []
         for stem, volume in req.stems.items():
             if volume > 0:
-                # Look for OGG files 
-                stem_path = session_path / f"{stem}.flac"
+                stem_path = _resolve_stem_path(session_path, stem)
                 if stem_path.exists():
-                    data, sr = sf.read(str(stem_path))
-                    
-                    # Apply volume
-                    data = data * volume
-                    
-                    if mixed_audio is None:
-                        mixed_audio = data
-                    else:
-                        # Ensure lengths match (pad if needed)
-                        if len(data) > len(mixed_audio):
-                            # Pad mixed
-                            pad = np.zeros((len(data) - len(mixed_audio), mixed_audio.shape[1]))
-                            mixed_audio = np.vstack((mixed_audio, pad))
-                        elif len(data) < len(mixed_audio):
-                            # Pad data
-                            pad = np.zeros((len(mixed_audio) - len(data), data.shape[1]))
-                            data = np.vstack((data, pad))
-                        
-                        mixed_audio += data
+                    selected.append((stem_path, volume, sf.info(str(stem_path))))
         
-        if mixed_audio is None:
+        if not selected:
              raise HTTPException(status_code=400, detail="No stems selected or found")
 
+        # Un seul accumulateur float32 (le plus long stem, les plus courts sont
+        # implicitement complétés par des zéros); lecture par petits blocs
+        # réutilisés (restent en cache L2) au lieu d'un stem entier par lecture
+        sr = selected[0][2].samplerate
+        channels = max(info.channels for _, _, info in selected)
+        max_frames = max(info.frames for _, _, info in selected)
+        mixed_audio = np.zeros((max_frames, channels), dtype=np.float32)
+        block_bufs = {}
+        
+        for stem_path, volume, info in selected:
+            gain = np.float32(volume)
+            # Un buffer par nombre de canaux (mono → broadcast sur tous les canaux)
+            block_buf = block_bufs.get(info.channels)
+            if block_buf is None:
+                block_buf = block_bufs[info.channels] = np.empty(
+                    (_MIX_BLOCK_FRAMES, info.channels), dtype=np.float32
+                )
+            with sf.SoundFile(str(stem_path)) as f:
+                start = 0
+                while True:
+                    block = f.read(_MIX_BLOCK_FRAMES, dtype='float32', always_2d=True, out=block_buf)
+                    n = len(block)
+                    if n == 0:
+                        break
+                    # Apply volume and accumulate
+                    target = mixed_audio[start:start + n]
+                    np.multiply(block, gain, out=block)
+                    np.add(target, block, out=target)
+                    start += n
+
         # Normalize to prevent clipping
         max_val = np.max(np.abs(mixed_audio))
         if max_val > 1.0:
-            mixed_audio = mixed_audio / max_val
+            mixed_audio /= max_val
+        # Garde-fou avant quantification 16 bits (arrondis float32 au-delà de ±1)
+        np.clip(mixed_audio, -1.0, 1.0, out=mixed_audio)
 
+        # 16 bits suffisent pour un mix d'écoute: fichier ~1/3 plus léger qu'en 24 bits
         output_mix = session_path / "mix.flac"
-        sf.write(str(output_mix), mixed_audio, sr, format='FLAC', subtype='PCM_24')
+        sf.write(str(output_mix), mixed_audio, sr, format='FLAC', subtype='PCM_16')
         
         return FileResponse(
             path=str(output_mix),
@@ -1094,21 +1209,38 @@ def mix_stems(req: MixRequest):
 
 
 
+# Taille des blocs lus par le streaming async des téléchargements
+_DOWNLOAD_CHUNK_SIZE = 1 << 20
+# En dessous de ce seuil, le fichier est renvoyé en une seule Response (pas de streaming)
+_SMALL_DOWNLOAD_BYTES = 64 * 1024
+
+
+async def _iter_file(path: Path, chunk_size: int = _DOWNLOAD_CHUNK_SIZE):
+    """Yield a file's bytes with aiofiles (no sync-iterator threadpool hop per chunk)"""
+    async with aiofiles.open(path, "rb") as f:
+        while chunk := await f.read(chunk_size):
+            yield chunk
+
+
 @app.get("/download/{session_id}/{stem_name}")
 def download_stem(session_id: str, stem_name: str):
     """
     Télécharge un stem spécifique
+    (def, pas async def: manifeste, stat et petites lectures restent dans le threadpool;
+    le générateur _iter_file est de toute façon itéré sur la boucle par Starlette)
     """
     # Handle stem_name with or without extension
     clean_name = stem_name
     if clean_name.endswith(".flac"):
         clean_name = clean_name[:-4]
         
-    file_path = TEMP_DIR / session_id / "output" / f"{clean_name}.flac"
+    file_path = _resolve_stem_path(TEMP_DIR / session_id / "output", clean_name)
     media_type = "audio/flac"
-    filename = f"{clean_name}.flac"
+    filename = file_path.name
     
-    if not file_path.exists():
+    try:
+        file_size = file_path.stat().st_size
+    except FileNotFoundError:
         logger.warning(
             f"Stem not found",
             extra={"session_id": session_id, "stem_name": stem_name}
@@ -1123,10 +1255,23 @@ def download_stem(session_id: str, stem_name: str):
         extra={"session_id": session_id, "stem_name": stem_name}
     )
     
-    return NoRangeFileResponse(
-        path=str(file_path),
-        media_type="audio/flac",
-        filename=f"{stem_name}.flac"
+    headers = {
+        "Accept-Ranges": "none",
+        "Content-Disposition": f'attachment; filename="{filename}"',
+    }
+    if USE_XACCEL:
+        # nginx sert le fichier lui-même; Python ne renvoie que les en-têtes
+        headers["X-Accel-Redirect"] = f"{XACCEL_PREFIX}/{session_id}/output/{filename}"
+        return Response(status_code=200, media_type=media_type, headers=headers)
+
+    # Réponse complète uniquement (pas de 206): Range est ignoré, Accept-Ranges: none
+    if file_size < _SMALL_DOWNLOAD_BYTES:
+        return Response(content=file_path.read_bytes(), media_type=media_type, headers=headers)
+
+    return StreamingResponse(
+        _iter_file(file_path),
+        media_type=media_type,
+        headers={**headers, "Content-Length": str(file_size)},
     )
 
 
@@ -1235,7 +1380,7 @@ def cleanup_on_exit():
         cleaned = cleanup_old_sessions(max_age_seconds=7200, max_to_check=100)
         
         # Optionally clear model cache if no active jobs
-        active_jobs = sum(1 for job in JOBS.values() if job.get("status") in ["pending", "running"])
+        active_jobs = JOBS.active_count
         models_cleared = False
         if active_jobs == 0:
             loaded = list(get_separator.__globals__.get('_loaded_models', {}).keys())
@@ -1277,6 +1422,17 @@ def cleanup_all():
     }
 
 
+async def _session_cleanup_loop(interval: float = _CLEANUP_INTERVAL):
+    """Periodic session sweep, off the request path (disk I/O runs in the default executor)"""
+    loop = asyncio.get_running_loop()
+    while True:
+        await asyncio.sleep(interval)
+        try:
+            await loop.run_in_executor(None, cleanup_old_sessions, 3600, 500)
+        except Exception as e:
+            logger.error(f"Error in background session cleanup: {e}")
+
+
 @asynccontextmanager
 async def lifespan(app: FastAPI):
     """Lifespan manager to initialize process pool and background metrics thread.
@@ -1346,27 +1502,17 @@ async def lifespan(app: FastAPI):
         _metrics_thread = threading.Thread(target=_metrics_updater_loop, name="metrics_updater", daemon=True)
         _metrics_thread.start()
 
-    # Create process pool for CPU-bound separation tasks
-    try:
-        # CRITICAL: Set spawn method for CUDA compatibility
-        # Fork doesn't work with CUDA - must use spawn
-        import multiprocessing
-        multiprocessing.set_start_method('spawn', force=True)
-        
-        _process_pool = ProcessPoolExecutor(max_workers=_PROCESS_POOL_MAX_WORKERS)
-        logger.info(f"ProcessPoolExecutor started with {_PROCESS_POOL_MAX_WORKERS} workers (spawn method)")
-        try:
-            process_pool_workers.set(_PROCESS_POOL_MAX_WORKERS)
-        except Exception:
-            pass
-    except Exception as e:
-        logger.error(f"Could not start process pool: {e}")
-        _process_pool = None
+    # Process pool is created lazily by get_process_pool() on the first job,
+    # so startup (and test runs that never submit work) skip the spawn cost
+
+    app.state.cleanup_task = asyncio.create_task(_session_cleanup_loop())
 
     try:
         yield
     finally:
         logger.info("Music Separator API shutting down (lifespan)")
+        # Stop background cleanup
+        app.state.cleanup_task.cancel()
         # Stop metrics thread
         try:
             _metrics_stop_event.set()
@@ -3,7 +3,7 @@ Prometheus Metrics for Music Separator API
 Tracks requests, errors, processing times, and resource usage
 """
 
-from prometheus_client import Counter, Histogram, Gauge, generate_latest, CONTENT_TYPE_LATEST
+from prometheus_client import Counter, Histogram, Gauge, generate_latest, CONTENT_TYPE_LATEST, REGISTRY
 from functools import wraps
 import time
 import psutil
@@ -13,6 +13,9 @@ import logging
 
 logger = logging.getLogger(__name__)
 
+# Registry scanned by get_metrics() (swappable, e.g. a fresh CollectorRegistry in tests)
+_REGISTRY = REGISTRY
+
 # ============================================================
 # REQUEST METRICS
 # ============================================================
@@ -345,9 +348,9 @@ def update_temp_storage_metrics(temp_dir: str):
 # METRICS ENDPOINT
 # ============================================================
 
-def get_metrics():
+def get_metrics(registry=None):
     """Generate metrics for Prometheus scraping"""
-    return generate_latest()
+    return generate_latest(registry if registry is not None else _REGISTRY)
 
 
 def get_metrics_content_type():
@@ -127,16 +127,19 @@ class CircuitBreaker:
         failure_threshold: int = 3,
         timeout: float = 60.0,
         expected_exception = (Exception,),
+        clock: Callable[[], float] = time.time,
     ):
         """
         Args:
             failure_threshold: Number of failures before opening circuit
             timeout: Seconds to wait before attempting recovery (HALF_OPEN)
             expected_exception: Exception type that counts as failure
+            clock: Time source in seconds (injectable for tests)
         """
         self.failure_threshold = failure_threshold
         self.timeout = timeout
         self.expected_exception = expected_exception
+        self._clock = clock
         
         self.failure_count = 0
         self.last_failure_time = None
@@ -176,7 +179,7 @@ class CircuitBreaker:
         """Check if enough time has passed to attempt reset"""
         if self.last_failure_time is None:
             return True
-        return time.time() - self.last_failure_time >= self.timeout
+        return self._clock() - self.last_failure_time >= self.timeout
     
     def _on_success(self):
         """Handle successful call"""
@@ -188,7 +191,7 @@ class CircuitBreaker:
     def _on_failure(self):
         """Handle failed call"""
         self.failure_count += 1
-        self.last_failure_time = time.time()
+        self.last_failure_time = self._clock()
         
         if self.state == CircuitBreakerState.HALF_OPEN:
             logger.warning("Circuit breaker test failed, reopening")
@@ -232,14 +235,16 @@ class RateLimiter:
             pass
     """
     
-    def __init__(self, max_requests: int, window_seconds: float):
+    def __init__(self, max_requests: int, window_seconds: float, clock: Callable[[], float] = time.time):
         """
         Args:
             max_requests: Maximum requests allowed in window
             window_seconds: Time window in seconds
+            clock: Time source in seconds (injectable for tests)
         """
         self.max_requests = max_requests
         self.window_seconds = window_seconds
+        self._clock = clock
         self.requests: Dict[str, list] = defaultdict(list)
     
     def limit(self, key: str = "default"):
@@ -268,7 +273,7 @@ class RateLimiter:
     
     def _allow_request(self, key: str) -> bool:
         """Check if request is allowed under rate limit"""
-        now = time.time()
+        now = self._clock()
         
         # Clean old requests outside window
         self.requests[key] = [
@@ -286,7 +291,7 @@ class RateLimiter:
     
     def get_remaining(self, key: str = "default") -> int:
         """Get remaining requests for key"""
-        now = time.time()
+        now = self._clock()
         self.requests[key] = [
             req_time for req_time in self.requests[key]
             if now - req_time < self.window_seconds
@@ -1,10 +1,15 @@
 """Music Source Separator - Sans TorchCodec/FFmpeg"""
-from src.stems import STEM_CONFIGS, get_stems, get_num_stems
+from src.stems import STEM_CONFIGS, get_stems
 
+import functools
+import json
+import os
+import weakref
+from collections import OrderedDict
 import torch
-import numpy as np
 from pathlib import Path
-from typing import Dict, Optional, Any, cast
+from types import MappingProxyType
+from typing import Dict, List, Optional, Any, Literal, Tuple
 import logging
 import soundfile as sf
 from demucs.pretrained import get_model
@@ -18,11 +23,32 @@ torch.set_num_interop_threads(1)
 logging.basicConfig(level=logging.INFO)
 logger = logging.getLogger(__name__)
 
+# Compromis qualité / vitesse pour apply_model: (shifts, overlap)
+# - shifts multiplie le calcul par (shifts + 1) pour un gain quasi inaudible
+# - overlap coûte ~1 / (1 - overlap) en passes supplémentaires
+QUALITY_PRESETS = {
+    "fast": (0, 0.05),
+    "balanced": (0, 0.15),
+    "best": (1, 0.25),
+}
 
+# Taille des blocs (en frames) pour l'écriture en flux des stems
+_WRITE_BLOCK_FRAMES = 65536
+
+# Manifeste stem → fichier écrit dans le dossier de sortie (évite de re-scanner output/)
+STEMS_MANIFEST = "stems.json"
+
+# INT8 dynamique sur CPU: opt-in tant que la qualité des stems n'est pas validée (SDR)
+QUANTIZE_INT8 = os.environ.get("QUANTIZE_INT8", "").lower() in ("1", "true", "yes")
+
+
+@functools.cache
 def get_best_device() -> str:
     """
     Détecte automatiquement le meilleur device disponible
     Priorité: CUDA > MPS > CPU
+    Résultat mis en cache (sonde CUDA/MPS une seule fois par process);
+    get_best_device.cache_clear() force une nouvelle détection.
     
     Returns:
         str: 'cuda', 'mps', ou 'cpu'
@@ -35,19 +61,40 @@ def get_best_device() -> str:
         return "cpu"
 
 
+def _stem_to_cpu(stem: torch.Tensor) -> torch.Tensor:
+    """Move a stem to CPU as a regular tensor.
+
+    Outputs of apply_model are inference tensors (no in-place edits or autograd
+    outside inference_mode); on CPU .cpu() returns them as is, so clone them.
+    """
+    stem = stem.cpu()
+    if stem.is_inference():
+        stem = stem.clone()
+    return stem
+
+
+def _check_quality(quality: str) -> None:
+    if quality not in QUALITY_PRESETS:
+        raise ValueError(f"Unknown quality: {quality} (expected one of {list(QUALITY_PRESETS)})")
+
+
 class MusicSeparator:
     # ✅ Use shared config instead of duplicating
     AVAILABLE_MODELS = {
         model_name: {
             "names": config["stems"],
-            "description": config["description"],
             "type": "demucs",
             "description": config['desc']
         }
         for model_name, config in STEM_CONFIGS.items()
     }
+    # Read-only view handed out by get_available_models() / get_model_info() (built once)
+    # Entries are proxied too: a shallow view would still let callers edit the shared table
+    _AVAILABLE_MODELS_VIEW = MappingProxyType(
+        {name: MappingProxyType(info) for name, info in AVAILABLE_MODELS.items()}
+    )
     
-    def __init__(self, model_name: str = "htdemucs_6s", device=None):
+    def __init__(self, model_name: str = "htdemucs_6s", device=None, quantize: Optional[bool] = None):
         if model_name not in self.AVAILABLE_MODELS:
             raise ValueError(f"Unknown model: {model_name}")
         
@@ -70,6 +117,11 @@ class MusicSeparator:
             self.device = get_best_device()
         self.model: Optional[Any] = None
         self.model_type = self.model_config["type"]
+        # INT8 dynamique uniquement sur CPU (pas de kernels quantifiés CUDA/MPS)
+        # quantize=None → QUANTIZE_INT8 (désactivé par défaut)
+        if quantize is None:
+            quantize = QUANTIZE_INT8
+        self.quantize = quantize and self.device == "cpu"
         
         logger.info(f"Init {model_name} sur {self.device}")
         
@@ -79,50 +131,153 @@ class MusicSeparator:
         logger.info(f"Chargement {self.model_name}...")
         self.model = get_model(name=self.model_name)
         self.model.to(self.device).eval()
+        if self.quantize:
+            self._quantize_model()
+        if self.device == "cuda":
+            # NHWC pour les Conv2d de la branche spectrale (tensor cores cuDNN)
+            # Seuls les poids 4D sont convertis; l'entrée (B, C, T) reste en 3D
+            try:
+                self.model.to(memory_format=torch.channels_last)
+            except Exception as e:
+                logger.warning(f"⚠️ channels_last not applied: {e}")
         logger.info("✅ Chargé")
+
+    def _quantize_model(self):
+        """Quantize Linear/LSTM weights to INT8 (dynamic) for the CPU fallback path.
+
+        Convolutions stay in FP32: static quantization would need a calibration
+        pass and FX-traceable modules, which demucs does not provide.
+        """
+        try:
+            torch.ao.quantization.quantize_dynamic(
+                self.model, {torch.nn.Linear, torch.nn.LSTM}, dtype=torch.qint8, inplace=True
+            )
+            logger.info("⚡ Poids Linear/LSTM quantifiés en INT8 (CPU)")
+        except Exception as e:
+            # Don't let quantization failure break separation: keep FP32 weights
+            logger.warning(f"⚠️ INT8 quantization skipped: {e}")
     
-    def separate(self, audio_path: str, output_dir: str) -> Dict[str, str]:
+    @classmethod
+    @functools.lru_cache(maxsize=8)
+    def _get_resampler(cls, orig_sr: int, target_sr: int, device: str):
+        """Build (once per (orig_sr, target_sr, device)) a Resample transform on device.
+
+        Constructing Resample precomputes its sinc kernel, so requests sharing a
+        source rate (44.1/48 kHz) reuse the same module.
+        """
+        import torchaudio
+        return torchaudio.transforms.Resample(orig_sr, target_sr).to(device)
+
+    def separate(
+        self,
+        audio_path: str,
+        output_dir: str,
+        quality: Literal["fast", "balanced", "best"] = "balanced",
+    ) -> Dict[str, str]:
+        _check_quality(quality)
         self._load_model()
         out = Path(output_dir)
         out.mkdir(parents=True, exist_ok=True)
-        return self._separate_demucs(audio_path, out)
+        return self._separate_demucs(audio_path, out, quality)
     
-    def _separate_demucs(self, audio_path: str, out: Path) -> Dict[str, str]:
-        # Charger avec soundfile (pas de torchcodec/ffmpeg)
-        audio_data, sr = sf.read(audio_path, always_2d=True)
-        
-        # Convertir en torch tensor (channels, samples)
-        wav = torch.from_numpy(audio_data.T).float()
-        
+    def separate_to_memory(
+        self,
+        audio_path: str,
+        quality: Literal["fast", "balanced", "best"] = "balanced",
+    ) -> Dict[str, Tuple[torch.Tensor, int]]:
+        """Separate without encoding: {stem: ((channels, samples) CPU tensor, samplerate)}
+
+        Returned tensors are regular (non-inference) tensors the caller owns.
+        """
+        _check_quality(quality)
+        self._load_model()
+        sources = self._run_demucs(audio_path, quality)
+        samplerate = self.model.samplerate
+        return {
+            name: (_stem_to_cpu(sources[i]), samplerate)
+            for i, name in enumerate(self.model_config["names"])
+        }
+
+    def separate_batch(
+        self,
+        audio_paths: List[str],
+        quality: Literal["fast", "balanced", "best"] = "balanced",
+    ) -> List[Dict[str, Tuple[torch.Tensor, int]]]:
+        """Separate several files in one forward pass (same format as separate_to_memory).
+
+        Inputs are zero-padded at the end to the longest one, stacked on the batch
+        dimension, and each output is trimmed back to its own length. Stems are
+        copied out of the batch (regular tensors, the batch output is not kept alive).
+        """
+        _check_quality(quality)
+        if not audio_paths:
+            return []
+        self._load_model()
+        wavs = [self._load_wav(path) for path in audio_paths]
+        lengths = [wav.shape[-1] for wav in wavs]
+        longest = max(lengths)
+        batch = torch.stack([
+            torch.nn.functional.pad(wav, (0, longest - length)) for wav, length in zip(wavs, lengths)
+        ])
+        del wavs
+        sources = self._forward(batch, quality)
+        samplerate = self.model.samplerate
+        return [
+            {
+                name: (_stem_to_cpu(sources[b, i, :, :length]), samplerate)
+                for i, name in enumerate(self.model_config["names"])
+            }
+            for b, length in enumerate(lengths)
+        ]
+
+    def _load_wav(self, audio_path: str) -> torch.Tensor:
+        """Read audio_path as a (2, samples) tensor on device at the model's sample rate"""
+        # Charger avec soundfile (pas de torchcodec/ffmpeg), directement en float32
+        audio_np, sr = sf.read(audio_path, dtype='float32', always_2d=True)
+
         # Ensure model is loaded and non-None for type checker
         if self.model is None:
             # Defensive: either load it or raise. Ici on préfère lever une erreur claire.
             raise RuntimeError("Model not loaded. Call _load_model() or use separate() which loads model.")
         model = self.model  # type: ignore[assignment]
-        
-        # Resample si nécessaire
+
+        # (samples, channels) -> (channels, samples), une seule copie host
+        wav_host = torch.from_numpy(audio_np.T).contiguous()
+        del audio_np
+
+        # Staging via pinned memory pour un transfert H2D asynchrone
+        if self.device == "cuda":
+            wav_host = wav_host.pin_memory()
+        wav = wav_host.to(self.device, non_blocking=True)
+        del wav_host
+
+        # Resample si nécessaire (sur le device, noyau sinc mis en cache)
         if sr != model.samplerate:
-            # Resample simple sans torchaudio
-            import scipy.signal
-            num_samples = int(wav.shape[1] * model.samplerate / sr)
-            wav_resampled = []
-            for channel in wav:
-                resampled = scipy.signal.resample(channel.numpy(), num_samples)
-                wav_resampled.append(torch.from_numpy(resampled))
-            wav = torch.stack(wav_resampled)
-        
-        # Normaliser si mono → stereo
+            resampler = MusicSeparator._get_resampler(sr, model.samplerate, self.device)
+            wav = resampler(wav)
+
+        # Normaliser si mono → stereo (vue broadcastée, sans copie)
+        # apply_model ne fait que lire l'entrée (pad/slices), une vue suffit
         if wav.shape[0] == 1:
-            wav = wav.repeat(2, 1)
-        
-        # Ajouter batch et envoyer au device
-        wav = wav.unsqueeze(0).to(self.device)
-        
-        # Séparer
-        with torch.no_grad():
-            sources = apply_model(model, wav, device=self.device, progress=True)
-        
-        sources = sources[0]  # Enlever batch
+            wav = wav.expand(2, wav.shape[1])
+        return wav
+
+    def _forward(self, batch: torch.Tensor, quality: str) -> torch.Tensor:
+        """Run apply_model on a (batch, channels, samples) tensor → (batch, stems, channels, samples)"""
+        shifts, overlap = QUALITY_PRESETS[quality]
+        # inference_mode: ni graphe autograd ni version counters (plus léger que no_grad)
+        with torch.inference_mode():
+            return apply_model(
+                self.model, batch, device=self.device, shifts=shifts, overlap=overlap, progress=True
+            )
+
+    def _run_demucs(self, audio_path: str, quality: str) -> torch.Tensor:
+        """Load audio and run apply_model; returns sources (stems, channels, samples) on device"""
+        # Ajouter batch, séparer, puis l'enlever
+        return self._forward(self._load_wav(audio_path).unsqueeze(0), quality)[0]
+
+    def _separate_demucs(self, audio_path: str, out: Path, quality: str = "balanced") -> Dict[str, str]:
+        sources = self._run_demucs(audio_path, quality)
         results = {}
         
         logger.info(f"📝 Starting to write {len(self.model_config['names'])} stems to disk...")
@@ -153,7 +308,13 @@ class MusicSeparator:
             # Write to disk using FLAC (stable, lossless, ~50% compression)
             logger.info(f"  💾 Writing {name}.flac to disk...")
             try:
-                sf.write(str(f), audio_np, self.model.samplerate, format='FLAC', subtype='PCM_24')
+                # Encodage en flux par blocs: mémoire bornée pendant l'écriture
+                with sf.SoundFile(
+                    str(f), mode='w', samplerate=self.model.samplerate,
+                    channels=audio_np.shape[1], format='FLAC', subtype='PCM_24'
+                ) as w:
+                    for start in range(0, len(audio_np), _WRITE_BLOCK_FRAMES):
+                        w.write(audio_np[start:start + _WRITE_BLOCK_FRAMES])
                 file_size_mb = f.stat().st_size / (1024 * 1024)
                 logger.info(f"  ✅ {name}.flac written successfully ({file_size_mb:.2f} MB)")
                 results[name] = str(f)
@@ -166,6 +327,9 @@ class MusicSeparator:
             logger.debug(f"  ✓ {name} numpy array freed")
         
         logger.info("✅ All stems written successfully")
+        (out / STEMS_MANIFEST).write_text(
+            json.dumps({name: Path(path).name for name, path in results.items()})
+        )
         
         # Clean up the entire sources tensor
         del sources
@@ -182,25 +346,44 @@ class MusicSeparator:
     
     @classmethod
     def get_available_models(cls): 
-        return cls.AVAILABLE_MODELS
+        return cls._AVAILABLE_MODELS_VIEW
     
     @classmethod
     def get_model_info(cls, name): 
-        """Get model information safely"""
+        """Get model information safely (shared read-only view)"""
         if name not in cls.AVAILABLE_MODELS:
             raise ValueError(f"Model '{name}' not found")
-        return cls.AVAILABLE_MODELS[name]
+        return cls._AVAILABLE_MODELS_VIEW[name]
+
 
+# Nombre de modèles gardés chargés (références fortes, ordre LRU)
+_MAX_LOADED_MODELS = 2
 
-_loaded_models = {}
+_loaded_models: "OrderedDict[str, MusicSeparator]" = OrderedDict()
+# Modèles évincés du LRU mais encore tenus par un job: réutilisés tant qu'ils vivent,
+# libérés (VRAM comprise) dès que plus personne ne les référence
+_evicted_models: "weakref.WeakValueDictionary[str, MusicSeparator]" = weakref.WeakValueDictionary()
 
 def get_separator(model_name: str):
-    if model_name not in _loaded_models:
-        _loaded_models[model_name] = MusicSeparator(model_name=model_name)
-    return _loaded_models[model_name]
+    separator = _loaded_models.get(model_name)
+    if separator is not None:
+        _loaded_models.move_to_end(model_name)
+        return separator
+
+    separator = _evicted_models.pop(model_name, None)
+    if separator is None:
+        separator = MusicSeparator(model_name=model_name)
+    _loaded_models[model_name] = separator
+    while len(_loaded_models) > _MAX_LOADED_MODELS:
+        old_name, old_separator = _loaded_models.popitem(last=False)
+        _evicted_models[old_name] = old_separator
+    return separator
 
 def clear_cache():
-    global _loaded_models
     for s in _loaded_models.values():
         s.unload_model()
-    _loaded_models.clear()
\ No newline at end of file
+    for s in list(_evicted_models.values()):
+        s.unload_model()
+    _loaded_models.clear()
+    _evicted_models.clear()
+    MusicSeparator._get_resampler.cache_clear()
\ No newline at end of file
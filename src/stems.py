@@ -1,4 +1,6 @@
 """Stem configuration for all models"""
+import functools
+import sys
 
 STEM_CONFIGS = {
     "htdemucs_6s": {
@@ -17,8 +19,14 @@ STEM_CONFIGS = {
     },
 }
 
+# Listes figées en tuples (immuables, partagées sans copie) et noms internés
+for _config in STEM_CONFIGS.values():
+    _config["stems"] = tuple(sys.intern(stem) for stem in _config["stems"])
+    _config["emoji"] = tuple(_config["emoji"])
+del _config
+
 # Helper functions
-def get_stems(model_name: str) -> list:
+def get_stems(model_name: str) -> tuple:
     """Get stem list for model"""
     if model_name not in STEM_CONFIGS:
         raise ValueError(f"Unknown model: {model_name}")
@@ -36,6 +44,7 @@ def get_num_stems(model_name: str) -> int:
     """Get number of stems for model"""
     return len(STEM_CONFIGS[model_name]["stems"])
 
+@functools.cache
 def get_max_stems() -> int:
-    """Get maximum stems across all models."""
+    """Get maximum stems across all models (STEM_CONFIGS is static: computed once)."""
     return max(len(config["stems"]) for config in STEM_CONFIGS.values())
@@ -1,189 +1,267 @@
 # tests/test_api.py
 import pytest
-from fastapi.testclient import TestClient
-import torch
-import torchaudio
-from unittest.mock import patch
-from src.api import app
-
-
-@pytest.fixture
-def client():
-    """Test client for API"""
-    return TestClient(app)
-
-
-@pytest.fixture
-def test_audio_file(tmp_path):
-    """Generate test audio file"""
-    audio = torch.randn(2, 44100 * 5)  # 5s stereo
-    test_file = tmp_path / "test.wav"
-    torchaudio.save(str(test_file), audio, 44100)
-    return test_file
+import pytest_asyncio
+from httpx import AsyncClient, ASGITransport
+import io
+import struct
+import orjson
+from unittest.mock import patch, AsyncMock
+
+# src.* imports are deferred to fixtures: importing the package pulls in
+# torch/demucs, which collection-only runs (--collect-only, -k) don't need.
+
+
+def _json(response):
+    """Decode a response body with orjson (faster than response.json())"""
+    return orjson.loads(response.content)
+
+
+@pytest_asyncio.fixture(scope="session")
+async def client():
+    """Async test client for API (in-process ASGI, no thread portal), built once"""
+    from src.api import app
+    async with AsyncClient(transport=ASGITransport(app=app), base_url="http://test") as c:
+        yield c
+
+
+@pytest.fixture(autouse=True)
+def restore_resilience_state():
+    """Snapshot and restore module-level resilience state around each test"""
+    from src.api import model_circuit_breaker, api_rate_limiter
+    cb_state = (
+        model_circuit_breaker.state,
+        model_circuit_breaker.failure_count,
+        model_circuit_breaker.last_failure_time,
+    )
+    rl_requests = {k: list(v) for k, v in api_rate_limiter.requests.items()}
+    yield
+    (
+        model_circuit_breaker.state,
+        model_circuit_breaker.failure_count,
+        model_circuit_breaker.last_failure_time,
+    ) = cb_state
+    api_rate_limiter.requests.clear()
+    api_rate_limiter.requests.update(rl_requests)
+
+
+def _silent_wav(seconds: int, sr: int = 44100, channels: int = 2) -> bytes:
+    """Build a PCM16 WAV (44-byte RIFF header + zero payload) in memory"""
+    block_align = channels * 2
+    data_size = seconds * sr * block_align
+    header = struct.pack(
+        "<4sI4s4sIHHIIHH4sI",
+        b"RIFF", 36 + data_size, b"WAVE",
+        b"fmt ", 16, 1, channels, sr, sr * block_align, block_align, 16,
+        b"data", data_size,
+    )
+    return header + bytes(data_size)
+
+
+TEST_WAV = _silent_wav(5)  # 5s stereo silence, built once at import
+
+
+@pytest.fixture(scope="session")
+def test_audio_file():
+    """Factory returning a fresh in-memory reader over the test WAV"""
+    return lambda: io.BytesIO(TEST_WAV)
+
+
+@pytest.fixture(scope="session")
+def fake_stems(tmp_path_factory):
+    """Stem files written once per session, standing in for real Demucs output"""
+    from src.stems import STEM_CONFIGS
+    out = tmp_path_factory.mktemp("stems")
+    stems = {}
+    for name in STEM_CONFIGS["htdemucs_6s"]["stems"]:
+        path = out / f"{name}.wav"
+        path.write_bytes(TEST_WAV)
+        stems[name] = str(path)
+    return stems
+
+
+@pytest.fixture(autouse=True)
+def fake_separator(fake_stems):
+    """Never run real Demucs inference from the API tests"""
+    # autospec keeps a real function object (the API reads get_separator.__globals__)
+    with patch("src.api.get_separator", autospec=True) as mock_get_separator:
+        mock_get_separator.return_value.separate.return_value = dict(fake_stems)
+        yield mock_get_separator
+
+
+class FakeFuture:
+    """Future that is already resolved and runs callbacks synchronously"""
+
+    def __init__(self, result_value):
+        self._result = result_value
+
+    def result(self):
+        return self._result
+
+    def add_done_callback(self, cb):
+        # call immediately to simulate synchronous completion
+        try:
+            cb(self)
+        except Exception:
+            pass
+
+
+class FakePool:
+    """Stand-in for the ProcessPoolExecutor: never spawns a worker"""
+
+    def submit(self, fn, *args, **kwargs):
+        # ignore fn/args and return a future with a fake result
+        fake_res = {
+            "vocals": "/tmp/test/vocals.wav",
+            "drums": "/tmp/test/drums.wav",
+            "bass": "/tmp/test/bass.wav",
+            "other": "/tmp/test/other.wav",
+        }
+        return FakeFuture(fake_res)
+
+
+_SHARED_FAKE_POOL = FakePool()
+
+
+@pytest_asyncio.fixture(scope="class")
+async def completed_job(client, test_audio_file, fake_process_pool):
+    """POST one separation per test class (fake pool) and share the response"""
+    with test_audio_file() as f:
+        return await client.post(
+            "/separate",
+            files={"file": ("test.wav", f, "audio/wav")},
+            data={"model_name": "htdemucs_6s"}
+        )
 
 
 class TestAPIEndpoints:
     """Test API endpoints"""
 
-    def test_root(self, client):
+    @pytest.fixture(autouse=True, scope="class")
+    def fake_process_pool(self):
+        """Replace the lazy pool factory once for the whole class (no worker is ever spawned)"""
+        from src import api as api_module
+        with patch.object(api_module, "get_process_pool", lambda: _SHARED_FAKE_POOL):
+            yield _SHARED_FAKE_POOL
+
+    async def test_root(self, client):
         """Test root endpoint"""
-        response = client.get("/")
+        response = await client.get("/")
         assert response.status_code == 200
-        data = response.json()
+        data = _json(response)
         assert data["name"] == "Music Source Separator API"
         assert "version" in data
         assert "endpoints" in data
 
-    def test_health_check(self, client):
+    async def test_health_check(self, client):
         """Test health check endpoint"""
-        response = client.get("/health")
+        response = await client.get("/health")
         assert response.status_code == 200
-        data = response.json()
+        data = _json(response)
         assert data["status"] == "healthy"
         assert "device" in data
         assert "models_loaded" in data
 
-    def test_metrics_endpoint(self, client):
+    async def test_metrics_endpoint(self, client):
         """Test metrics endpoint"""
-        response = client.get("/metrics")
+        response = await client.get("/metrics")
         assert response.status_code == 200
         assert "text/plain" in response.headers["content-type"]
 
-    def test_list_models(self, client):
+    async def test_list_models(self, client):
         """Test list models endpoint"""
-        response = client.get("/models")
+        response = await client.get("/models")
         assert response.status_code == 200
-        data = response.json()
+        data = _json(response)
         assert "models" in data
         assert "total" in data
-        assert len(data["models"]) > 0
         assert "htdemucs_6s" in data["models"]
 
-    def test_get_model_info(self, client):
+    async def test_get_model_info(self, client):
         """Test get model info endpoint"""
-        response = client.get("/models/htdemucs_6s")
+        response = await client.get("/models/htdemucs_6s")
         assert response.status_code == 200
-        data = response.json()
+        data = _json(response)
         assert "names" in data  # Changed from "stems" to "names"
         assert "description" in data
 
-    def test_get_invalid_model_info(self, client):
+    async def test_get_invalid_model_info(self, client):
         """Test get info for invalid model"""
-        response = client.get("/models/fake_model")
+        response = await client.get("/models/fake_model")
         assert response.status_code == 404  # Should return 404, not 500
 
-    def test_separate_audio_success(self, client, test_audio_file):
+    async def test_separate_audio_success(self, completed_job):
         """Test successful audio separation"""
-        # Patch the process pool so the job runs synchronously in-test
-        from src import api as api_module
-
-        class FakeFuture:
-            def __init__(self, result_value):
-                self._result = result_value
-                self._callbacks = []
-
-            def result(self):
-                return self._result
-
-            def add_done_callback(self, cb):
-                # call immediately to simulate synchronous completion
-                try:
-                    cb(self)
-                except Exception:
-                    pass
-
-        class FakePool:
-            def submit(self, fn, *args, **kwargs):
-                # ignore fn/args and return a future with a fake result
-                fake_res = {
-                    "vocals": "/tmp/test/vocals.wav",
-                    "drums": "/tmp/test/drums.wav",
-                    "bass": "/tmp/test/bass.wav",
-                    "other": "/tmp/test/other.wav",
-                }
-                return FakeFuture(fake_res)
-
-        fake_pool = FakePool()
-
-        # replace the real process pool on the module
-        with patch.object(api_module, "_process_pool", fake_pool):
-            with open(test_audio_file, "rb") as f:
-                response = client.post(
-                    "/separate",
-                    files={"file": ("test.wav", f, "audio/wav")},
-                    data={"model_name": "htdemucs_6s"}
-                )
-
-        assert response.status_code == 200
-        data = response.json()
+        assert completed_job.status_code == 200
+        data = _json(completed_job)
         assert data["status"] == "accepted"
         assert "job_id" in data
         assert "session_id" in data
         assert data["status_url"].startswith("/status/")
 
-        # Poll status endpoint to confirm job completed and result present
-        job_id = data["job_id"]
-        status_resp = client.get(f"/status/{job_id}")
+    async def test_get_job_status(self, client, completed_job):
+        """Test polling the status of a submitted job"""
+        job_id = _json(completed_job)["job_id"]
+        status_resp = await client.get(f"/status/{job_id}")
         assert status_resp.status_code == 200
-        status_data = status_resp.json()
+        status_data = _json(status_resp)
         assert status_data["status"] in ("done", "running", "pending")
         # If fake pool invoked callbacks synchronously, it should be done
         if status_data["status"] == "done":
             assert "result" in status_data
 
-    def test_separate_invalid_model(self, client, test_audio_file):
+    async def test_separate_invalid_model(self, client, test_audio_file):
         """Test separation with invalid model"""
-        with open(test_audio_file, "rb") as f:
-            response = client.post(
+        with test_audio_file() as f:
+            response = await client.post(
                 "/separate",
                 files={"file": ("test.wav", f, "audio/wav")},
                 data={"model_name": "fake_model"}
             )
 
         assert response.status_code == 400
-        assert "non disponible" in response.json()["detail"]
+        assert "non disponible" in _json(response)["detail"]
 
-    def test_separate_missing_file(self, client):
+    async def test_separate_missing_file(self, client):
         """Test separation without file"""
-        response = client.post("/separate", data={"model_name": "htdemucs_6s"})
+        response = await client.post("/separate", data={"model_name": "htdemucs_6s"})
         assert response.status_code == 422
 
-    def test_download_stem_not_found(self, client):
+    async def test_download_stem_not_found(self, client):
         """Test downloading non-existent stem"""
-        response = client.get("/download/fake_session/fake_stem")
+        response = await client.get("/download/fake_session/fake_stem")
         assert response.status_code == 404
 
-    def test_clear_cache(self, client):
+    async def test_clear_cache(self, client):
         """Test clear cache endpoint"""
-        response = client.post("/clear-cache")
+        response = await client.post("/clear-cache")
         assert response.status_code == 200
-        data = response.json()
+        data = _json(response)
         assert data["status"] == "success"
 
-    def test_cleanup_session_not_found(self, client):
+    async def test_cleanup_session_not_found(self, client):
         """Test cleanup non-existent session"""
-        response = client.delete("/cleanup/fake_session")
+        response = await client.delete("/cleanup/fake_session")
         assert response.status_code == 404
 
-    def test_cleanup_all(self, client):
+    async def test_cleanup_all(self, client):
         """Test cleanup all sessions"""
-        response = client.post("/cleanup-all")
+        response = await client.post("/cleanup-all")
         assert response.status_code == 200
-        data = response.json()
+        data = _json(response)
         assert data["status"] == "success"
 
 
 class TestAPIMiddleware:
     """Test API middleware"""
 
-    def test_metrics_middleware(self, client, test_audio_file):
+    async def test_metrics_middleware(self, client):
         """Test that metrics are recorded"""
         # Make a request to trigger metrics
-        response = client.get("/health")
+        response = await client.get("/health")
         assert response.status_code == 200
 
         # Check metrics endpoint
-        metrics_response = client.get("/metrics")
+        metrics_response = await client.get("/metrics")
         assert metrics_response.status_code == 200
         assert "http_requests_total" in metrics_response.text
 
@@ -191,7 +269,7 @@ class TestAPIMiddleware:
 class TestRateLimiting:
     """Test rate limiting functionality"""
 
-    def test_rate_limit_exceeded(self, client, test_audio_file):
+    async def test_rate_limit_exceeded(self, client):
         """Test rate limiting behavior"""
         # This test would require more complex setup to trigger rate limiting
         # For now, we test that the rate limiter is properly initialized
@@ -202,7 +280,13 @@ class TestRateLimiting:
 class TestCircuitBreaker:
     """Test circuit breaker functionality"""
 
-    def test_circuit_breaker_open(self, client, test_audio_file):
+    @pytest.fixture(autouse=True)
+    def no_backoff_sleep(self):
+        """Make any retry/backoff sleep return instantly (logic still runs)"""
+        with patch("asyncio.sleep", new=AsyncMock()), patch("time.sleep"):
+            yield
+
+    async def test_circuit_breaker_open(self, client, test_audio_file):
         """Test circuit breaker open state"""
         from src.api import model_circuit_breaker
         
@@ -213,8 +297,8 @@ class TestCircuitBreaker:
         with patch('src.api.get_separator') as mock_get_separator:
             mock_get_separator.side_effect = Exception("Circuit breaker test")
             
-            with open(test_audio_file, "rb") as f:
-                response = client.post(
+            with test_audio_file() as f:
+                response = await client.post(
                     "/separate",
                     files={"file": ("test.wav", f, "audio/wav")},
                     data={"model_name": "htdemucs_6s"}
@@ -230,21 +314,121 @@ class TestCircuitBreaker:
 class TestCleanupEndpoints:
     """Test cleanup-related endpoints"""
     
-    def test_cleanup_on_exit_endpoint(self, client):
+    async def test_cleanup_on_exit_endpoint(self, client):
         """Test cleanup-on-exit endpoint"""
-        response = client.post("/cleanup-on-exit")
+        response = await client.post("/cleanup-on-exit")
         assert response.status_code == 200
-        data = response.json()
+        data = _json(response)
         assert data["status"] == "success"
         assert "sessions_cleaned" in data
         assert "models_cleared" in data
         assert isinstance(data["sessions_cleaned"], int)
         assert isinstance(data["models_cleared"], bool)
-    
-    def test_cleanup_on_exit_returns_counts(self, client):
-        """Test that cleanup-on-exit returns proper counts"""
-        response = client.post("/cleanup-on-exit")
-        assert response.status_code == 200
-        data = response.json()
         # Should return non-negative counts
         assert data["sessions_cleaned"] >= 0
+
+
+class TestLocalMediaURLs:
+    """Test the dev-only file:// short-circuit of the YouTube downloader"""
+
+    def test_file_url_rejected_by_default(self, tmp_path, monkeypatch):
+        """Test file:// URLs are refused unless explicitly enabled"""
+        from src import api
+        monkeypatch.setattr(api, "ALLOW_LOCAL_MEDIA_URLS", False)
+        clip = tmp_path / "clip.wav"
+        clip.write_bytes(_silent_wav(1))
+        with pytest.raises(ValueError):
+            api.download_youtube_audio(clip.as_uri(), tmp_path)
+
+    def test_file_url_skips_yt_dlp(self, tmp_path, monkeypatch):
+        """Test an enabled file:// URL becomes input.wav without calling yt-dlp"""
+        from src import api
+        monkeypatch.setattr(api, "ALLOW_LOCAL_MEDIA_URLS", True)
+        clip = tmp_path / "clip.wav"
+        clip.write_bytes(_silent_wav(1))
+        with patch("src.api.yt_dlp.YoutubeDL") as mock_ydl:
+            result = api.download_youtube_audio(clip.as_uri(), tmp_path)
+        assert result == tmp_path / "input.wav"
+        assert result.exists()
+        mock_ydl.assert_not_called()
+
+
+class TestProcessPool:
+    """Test lazy creation of the shared process pool"""
+
+    def test_get_process_pool_creates_one_pool_under_contention(self, monkeypatch):
+        """Test concurrent first calls build a single ProcessPoolExecutor"""
+        import threading
+        import time
+        from src import api
+        monkeypatch.setattr(api, "_process_pool", None)
+        created = []
+
+        def slow_pool(*args, **kwargs):
+            time.sleep(0.05)  # widen the check-and-create window
+            pool = object()
+            created.append(pool)
+            return pool
+
+        monkeypatch.setattr(api, "ProcessPoolExecutor", slow_pool)
+        barrier = threading.Barrier(8)
+        results = []
+
+        def worker():
+            barrier.wait()
+            results.append(api.get_process_pool())
+
+        threads = [threading.Thread(target=worker) for _ in range(8)]
+        for t in threads:
+            t.start()
+        for t in threads:
+            t.join()
+
+        assert len(created) == 1
+        assert all(pool is created[0] for pool in results)
+
+
+class TestJobManager:
+    """Test JobManager's active-job bookkeeping"""
+
+    @pytest.fixture(params=["memory", "disk"])
+    def jobs(self, request, tmp_path):
+        from src.api import JobManager
+        return JobManager(str(tmp_path / "jobs") if request.param == "disk" else None)
+
+    @pytest.mark.parametrize("final_status", ["done", "error"])
+    def test_status_transitions_update_active_count(self, jobs, final_status):
+        """Test pending → running → done/error moves active_count up then back down"""
+        assert jobs.active_count == 0
+        jobs["a"] = {"status": "pending", "session_id": "s_a"}
+        assert jobs.active_count == 1
+        assert jobs.active_session_ids() == {"s_a"}
+
+        job = jobs["a"]
+        job["status"] = "running"
+        jobs["a"] = job
+        assert jobs.active_count == 1
+
+        job["status"] = final_status
+        jobs["a"] = job
+        assert jobs.active_count == 0
+        assert "a" not in jobs._active_ids
+        assert jobs.active_session_ids() == set()
+
+    def test_delete_active_job_decrements_count(self, jobs):
+        """Test del on a pending/running job drops it from the active set"""
+        jobs["a"] = {"status": "running", "session_id": "s_a"}
+        jobs["b"] = {"status": "pending", "session_id": "s_b"}
+        assert jobs.active_count == 2
+
+        del jobs["a"]
+        assert jobs.active_count == 1
+        assert "a" not in jobs
+        assert jobs.active_session_ids() == {"s_b"}
+
+    def test_overwrite_with_terminal_status(self, jobs):
+        """Test replacing an active job with a terminal-status dict clears it"""
+        jobs["a"] = {"status": "running"}
+        jobs["a"] = {"status": "done", "result": {}}
+        assert jobs.active_count == 0
+        assert jobs._active_ids == set()
@@ -7,6 +7,30 @@ from src.logging_config import (
     log_request, log_separation, log_error, log_model_load
 )
 
+@pytest.fixture(scope="module", autouse=True)
+def quiet_third_party_loggers():
+    """Keep third-party loggers out of caplog for this module, then restore them"""
+    loggers = [logging.getLogger(name) for name in ("uvicorn", "fastapi", "torchaudio")]
+    saved = [lg.disabled for lg in loggers]
+    for lg in loggers:
+        lg.disabled = True
+    yield
+    for lg, disabled in zip(loggers, saved):
+        lg.disabled = disabled
+
+
+# exc_info tuple built once at import, reused by formatter tests
+try:
+    raise ValueError("Test error")
+except ValueError as _e:
+    _EXC_INFO = (type(_e), _e, _e.__traceback__)
+
+
+@pytest.fixture(scope="module")
+def logger():
+    """Logger shared by the structured logging tests"""
+    return get_logger("test_structured")
+
 
 class TestStructuredFormatter:
     """Test structured formatter"""
@@ -34,24 +58,21 @@ class TestStructuredFormatter:
     def test_format_with_exception(self):
         """Test formatting with exception info"""
         formatter = StructuredFormatter()
-        try:
-            raise ValueError("Test error")
-        except ValueError as e:
-            record = logging.LogRecord(
-                name="test",
-                level=logging.ERROR,
-                pathname="",
-                lineno=0,
-                msg="Error occurred",
-                args=(),
-                exc_info=(type(e), e, e.__traceback__)
-            )
-            
-            formatted = formatter.format(record)
-            parsed = json.loads(formatted)
-            
-            assert "exception" in parsed
-            assert parsed["exception"]["type"] == "ValueError"
+        record = logging.LogRecord(
+            name="test",
+            level=logging.ERROR,
+            pathname="",
+            lineno=0,
+            msg="Error occurred",
+            args=(),
+            exc_info=_EXC_INFO
+        )
+
+        formatted = formatter.format(record)
+        parsed = json.loads(formatted)
+
+        assert "exception" in parsed
+        assert parsed["exception"]["type"] == "ValueError"
 
 
 class TestContextLogger:
@@ -100,48 +121,48 @@ class TestLoggingSetup:
 
 
 class TestStructuredLogging:
-    """Test structured logging functions"""
+    """Test structured logging functions
+
+    The log_* helpers pass pre-formatted messages (no %-args), so the raw
+    record.msg is checked instead of re-rendering it with getMessage().
+    """
+
+    @pytest.fixture(autouse=True)
+    def capture_info(self, caplog):
+        caplog.set_level(logging.INFO)
 
-    def test_log_request(self, caplog):
+    def test_log_request(self, caplog, logger):
         """Test logging HTTP request"""
-        logger = get_logger("test")
-        with caplog.at_level(logging.INFO):
-            log_request(logger, "GET", "/test", 200, 0.5, user_id="user123")
-            
-            # Check that log was recorded
-            assert len(caplog.records) > 0
-            record = caplog.records[0]
-            assert "GET /test - 200" in record.getMessage()
-
-    def test_log_separation(self, caplog):
+        log_request(logger, "GET", "/test", 200, 0.5, user_id="user123")
+
+        # Check that log was recorded
+        assert len(caplog.records) > 0
+        record = caplog.records[0]
+        assert record.msg.startswith("GET /test - 200")
+
+    def test_log_separation(self, caplog, logger):
         """Test logging audio separation"""
-        logger = get_logger("test")
-        with caplog.at_level(logging.INFO):
-            log_separation(logger, "htdemucs", 30.0, 10.0, "success", session_id="sess123")
-            
-            assert len(caplog.records) > 0
-            record = caplog.records[0]
-            assert "Separation completed" in record.getMessage()
-
-    def test_log_error(self, caplog):
+        log_separation(logger, "htdemucs", 30.0, 10.0, "success", session_id="sess123")
+
+        assert len(caplog.records) > 0
+        record = caplog.records[0]
+        assert record.msg.startswith("Separation completed")
+
+    def test_log_error(self, caplog, logger):
         """Test logging error"""
-        logger = get_logger("test")
-        with caplog.at_level(logging.ERROR):
-            try:
-                raise ValueError("Test error")
-            except ValueError as e:
-                log_error(logger, e, context="test_operation")
-            
-            assert len(caplog.records) > 0
-            record = caplog.records[0]
-            assert "Error:" in record.getMessage()
-
-    def test_log_model_load(self, caplog):
+        try:
+            raise ValueError("Test error")
+        except ValueError as e:
+            log_error(logger, e, context="test_operation")
+
+        assert len(caplog.records) > 0
+        record = caplog.records[0]
+        assert record.msg.startswith("Error:")
+
+    def test_log_model_load(self, caplog, logger):
         """Test logging model load"""
-        logger = get_logger("test")
-        with caplog.at_level(logging.INFO):
-            log_model_load(logger, "htdemucs", 2.5, "cuda", success=True)
-            
-            assert len(caplog.records) > 0
-            record = caplog.records[0]
-            assert "Model loaded" in record.getMessage()
\ No newline at end of file
+        log_model_load(logger, "htdemucs", 2.5, "cuda", success=True)
+
+        assert len(caplog.records) > 0
+        record = caplog.records[0]
+        assert record.msg.startswith("Model loaded")
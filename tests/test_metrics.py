@@ -1,6 +1,8 @@
 # tests/test_metrics.py
 import pytest
-from unittest.mock import patch
+import psutil
+from types import SimpleNamespace
+from prometheus_client import CollectorRegistry
 
 from src.metrics import (
     http_requests_total, http_request_duration_seconds, separations_total,
@@ -10,6 +12,16 @@ from src.metrics import (
 )
 
 
+@pytest.fixture(autouse=True)
+def fresh_registry(monkeypatch):
+    """Scan a per-test registry holding only the metrics these tests touch"""
+    registry = CollectorRegistry()
+    for metric in (http_requests_total, separations_total, errors_total):
+        registry.register(metric)
+    monkeypatch.setattr("src.metrics._REGISTRY", registry)
+    return registry
+
+
 class TestMetrics:
     """Test Prometheus metrics"""
 
@@ -34,28 +46,36 @@ class TestMetrics:
         # Test errors_total
         errors_total.labels(type="TestError", endpoint="/test").inc()
 
-    def test_update_system_metrics(self):
+    def test_update_system_metrics(self, monkeypatch):
         """Test updating system metrics"""
-        with patch('psutil.cpu_percent') as mock_cpu, \
-             patch('psutil.virtual_memory') as mock_memory, \
-             patch('psutil.disk_usage') as mock_disk:
-            
-            mock_cpu.return_value = 50.0
-            mock_memory.return_value.percent = 60.0
-            mock_disk.return_value.percent = 40.0
-            
-            update_system_metrics()
-            
-            # Verify mocks were called
-            mock_cpu.assert_called_once()
-            mock_memory.assert_called_once()
-            mock_disk.assert_called_once()
+        calls = []
+
+        def fake_cpu_percent(interval=None):
+            calls.append("cpu")
+            return 50.0
+
+        def fake_virtual_memory():
+            calls.append("memory")
+            return SimpleNamespace(used=6e9, available=4e9, percent=60.0)
+
+        def fake_disk_usage(path):
+            calls.append("disk")
+            return SimpleNamespace(used=4e10, free=6e10, percent=40.0)
+
+        monkeypatch.setattr(psutil, "cpu_percent", fake_cpu_percent)
+        monkeypatch.setattr(psutil, "virtual_memory", fake_virtual_memory)
+        monkeypatch.setattr(psutil, "disk_usage", fake_disk_usage)
+
+        update_system_metrics()
+
+        # Each probe called exactly once
+        assert calls == ["cpu", "memory", "disk"]
 
     def test_update_temp_storage_metrics(self, tmp_path):
         """Test updating temp storage metrics"""
         # Create some test files
         test_file = tmp_path / "test.txt"
-        test_file.write_text("test content" * 100)  # ~1.2KB
+        test_file.write_bytes(b"x" * 1200)  # ~1.2KB
         
         update_temp_storage_metrics(str(tmp_path))
         
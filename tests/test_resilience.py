@@ -9,6 +9,19 @@ from src.resilience import (
 )
 
 
+class FakeClock:
+    """Manually advanced time source for CircuitBreaker/RateLimiter"""
+
+    def __init__(self, start: float = 1000.0):
+        self.now = start
+
+    def __call__(self) -> float:
+        return self.now
+
+    def advance(self, seconds: float):
+        self.now += seconds
+
+
 class TestRetry:
     """Test retry functionality"""
 
@@ -110,7 +123,8 @@ class TestCircuitBreaker:
 
     def test_circuit_breaker_half_open_state(self):
         """Test circuit breaker half-open state"""
-        cb = CircuitBreaker(failure_threshold=1, timeout=0.1)
+        clock = FakeClock()
+        cb = CircuitBreaker(failure_threshold=1, timeout=0.1, clock=clock)
         
         @cb.call
         def failing_func():
@@ -121,7 +135,7 @@ class TestCircuitBreaker:
             failing_func()
         
         # Wait for timeout
-        time.sleep(0.2)
+        clock.advance(0.2)
         
         # Next call should be in half-open state
         with pytest.raises(Exception):
@@ -133,7 +147,8 @@ class TestCircuitBreaker:
 
     def test_circuit_breaker_recovery(self):
         """Test circuit breaker recovery"""
-        cb = CircuitBreaker(failure_threshold=1, timeout=0.1)
+        clock = FakeClock()
+        cb = CircuitBreaker(failure_threshold=1, timeout=0.1, clock=clock)
         
         call_count = 0
         
@@ -150,7 +165,7 @@ class TestCircuitBreaker:
             sometimes_failing_func()
         
         # Wait for timeout
-        time.sleep(0.2)
+        clock.advance(0.2)
         
         # Second call should succeed and close circuit
         result = sometimes_failing_func()
@@ -174,7 +189,8 @@ class TestRateLimiter:
 
     def test_rate_limiter_window_expiration(self):
         """Test rate limiter window expiration"""
-        limiter = RateLimiter(max_requests=2, window_seconds=0.1)
+        clock = FakeClock()
+        limiter = RateLimiter(max_requests=2, window_seconds=0.1, clock=clock)
         
         # First 2 requests allowed
         assert limiter._allow_request("test_key") is True
@@ -184,7 +200,7 @@ class TestRateLimiter:
         assert limiter._allow_request("test_key") is False
         
         # Wait for window to expire
-        time.sleep(0.2)
+        clock.advance(0.2)
         
         # Should allow requests again
         assert limiter._allow_request("test_key") is True
@@ -1,26 +1,73 @@
 # tests/test_separator.py
 
+import json
+import numpy as np
 import pytest
+import soundfile as sf
 import torch
-import torchaudio
 from pathlib import Path
 from unittest.mock import patch, MagicMock
-from src.separator import MusicSeparator, get_separator, clear_cache, get_best_device
+from src.separator import MusicSeparator, get_separator, clear_cache, get_best_device, STEMS_MANIFEST
 from src.stems import STEM_CONFIGS
 
+# Test WAVs are written with soundfile directly. torchaudio is only loaded by
+# the tests that feed 48 kHz input (MusicSeparator._get_resampler).
 
-@pytest.fixture
-def test_audio(tmp_path):
-    """Generate test audio file"""
-    audio = torch.randn(2, 44100 * 5)  # 5s stereo
-    test_file = tmp_path / "test.wav"
-    torchaudio.save(str(test_file), audio, 44100)
+
+@pytest.fixture(scope="session")
+def test_audio(tmp_path_factory):
+    """Generate test audio file (once per session, tests only read it)"""
+    audio = np.zeros((44100, 2), dtype=np.float32)  # 1s stereo silence (only structure is checked)
+    test_file = tmp_path_factory.mktemp("audio") / "test.wav"
+    sf.write(str(test_file), audio, 44100, subtype='PCM_16')
+    return test_file
+
+
+@pytest.fixture(scope="session")
+def test_audio_48k(tmp_path_factory):
+    """1s stereo silence at 48 kHz (exercises the resampling path), written once"""
+    audio = np.zeros((48000, 2), dtype=np.float32)
+    test_file = tmp_path_factory.mktemp("audio_48k") / "test_48k.wav"
+    sf.write(str(test_file), audio, 48000, subtype='PCM_16')
+    return test_file
+
+
+@pytest.fixture(scope="session")
+def mono_audio(tmp_path_factory):
+    """1s mono silence at 44.1 kHz (exercises the mono → stereo path), written once"""
+    test_file = tmp_path_factory.mktemp("audio_mono") / "mono.wav"
+    sf.write(str(test_file), np.zeros(44100, dtype=np.float32), 44100, subtype='PCM_16')
     return test_file
 
 
+@pytest.fixture(scope="session")
+def separator_cache():
+    """One MusicSeparator per model, shared by tests that don't mutate it"""
+    return {}
+
+
+@pytest.fixture
+def cached_separator(request, separator_cache):
+    """Separator for request.param (indirect parametrize), htdemucs_6s by default.
+
+    Built on first use only: weights stay loaded across tests and parameters.
+    """
+    model_name = getattr(request, "param", "htdemucs_6s")
+    if model_name not in separator_cache:
+        separator_cache[model_name] = MusicSeparator(model_name=model_name)
+    return separator_cache[model_name]
+
+
 class TestDeviceDetection:
     """Test device detection functionality"""
 
+    @pytest.fixture(autouse=True)
+    def fresh_device_cache(self):
+        """get_best_device is cached: re-probe under each patch, don't leak the result"""
+        get_best_device.cache_clear()
+        yield
+        get_best_device.cache_clear()
+
     def test_get_best_device_cuda(self):
         """Test CUDA device detection"""
         with patch('torch.cuda.is_available', return_value=True):
@@ -45,11 +92,16 @@ class TestDeviceDetection:
 class TestMusicSeparator:
     """Test MusicSeparator class"""
 
-    def test_separator_initialization(self):
-        """Test separator can be initialized"""
-        separator = MusicSeparator(model_name="htdemucs_6s")
-        assert separator.model_name == "htdemucs_6s"
-        assert len(separator.stems) == 6
+    @pytest.mark.parametrize(
+        "cached_separator, model_name, num_stems",
+        [("htdemucs_6s", "htdemucs_6s", 6), ("htdemucs_ft", "htdemucs_ft", 4)],
+        indirect=["cached_separator"],
+    )
+    def test_separator_initialization(self, cached_separator, model_name, num_stems):
+        """Test separator can be initialized for every model"""
+        separator = cached_separator
+        assert separator.model_name == model_name
+        assert len(separator.stems) == num_stems
         assert separator.device in ["cuda", "cpu", "mps"]
 
     def test_separator_invalid_model(self):
@@ -59,10 +111,12 @@ class TestMusicSeparator:
 
     def test_separator_model_info(self):
         """Test model info retrieval"""
-        separator = MusicSeparator(model_name="htdemucs_6s")
         info = MusicSeparator.get_model_info("htdemucs_6s")
         assert "names" in info  # Fixed: changed from "stems" to "names"
         assert "description" in info
+        # Cached and shared between callers: must not be mutable
+        with pytest.raises(TypeError):
+            info["description"] = "changed"
 
     def test_load_model(self):
         """Test model loading"""
@@ -73,6 +127,36 @@ class TestMusicSeparator:
             separator._load_model()
             assert separator.model is not None
 
+    def test_quantize_off_by_default(self):
+        """Test INT8 quantization is opt-in (QUANTIZE_INT8 unset)"""
+        with patch('src.separator.QUANTIZE_INT8', False):
+            separator = MusicSeparator(model_name="htdemucs_6s", device="cpu")
+        assert separator.quantize is False
+
+    def test_quantize_cpu_only(self):
+        """Test quantization is only enabled on CPU, even when requested"""
+        assert MusicSeparator(model_name="htdemucs_6s", device="cpu", quantize=True).quantize is True
+        with patch('torch.cuda.is_available', return_value=True):
+            separator = MusicSeparator(model_name="htdemucs_6s", device="cuda", quantize=True)
+        assert separator.quantize is False
+
+    def test_load_model_quantizes_on_cpu(self):
+        """Test _load_model applies dynamic INT8 to the CPU model"""
+        separator = MusicSeparator(model_name="htdemucs_6s", device="cpu", quantize=True)
+        with patch('src.separator.get_model'), \
+                patch('torch.ao.quantization.quantize_dynamic') as mock_quantize:
+            separator._load_model()
+        mock_quantize.assert_called_once()
+        assert mock_quantize.call_args[0][0] is separator.model
+
+    def test_quantize_failure_keeps_fp32_model(self):
+        """Test a quantize_dynamic error is logged, not raised"""
+        separator = MusicSeparator(model_name="htdemucs_6s", device="cpu", quantize=True)
+        with patch('src.separator.get_model'), \
+                patch('torch.ao.quantization.quantize_dynamic', side_effect=RuntimeError("no qengine")):
+            separator._load_model()
+        assert separator.model is not None
+
     def test_separate_method(self, test_audio, tmp_path):
         """Test separation method"""
         separator = MusicSeparator(model_name="htdemucs_6s")
@@ -87,8 +171,14 @@ class TestMusicSeparator:
             
             with patch('src.separator.apply_model') as mock_apply_model:
                 # Create mock separated sources
-                mock_sources = torch.randn(1, 6, 2, 44100 * 5)  # batch, stems, channels, samples
-                mock_apply_model.return_value = mock_sources
+                mock_sources = torch.randn(1, 6, 2, 44100)  # batch, stems, channels, samples
+                inference_modes = []
+
+                def fake_apply_model(*args, **kwargs):
+                    inference_modes.append(torch.is_inference_mode_enabled())
+                    return mock_sources
+
+                mock_apply_model.side_effect = fake_apply_model
                 
                 output_dir = tmp_path / "output"
                 results = separator.separate(str(test_audio), str(output_dir))
@@ -96,7 +186,91 @@ class TestMusicSeparator:
                 assert len(results) == 6
                 for stem in ["vocals", "drums", "bass", "other", "guitar", "piano"]:
                     assert stem in results
-                    assert Path(results[stem]).exists()
+                    # Header-only read: no need to decode the stem for shape/SR
+                    info = sf.info(results[stem])
+                    assert info.channels == 2
+                    assert info.samplerate == 44100
+
+                # stem → filename manifest written next to the stems
+                manifest = json.loads((output_dir / STEMS_MANIFEST).read_text())
+                assert manifest == {name: Path(p).name for name, p in results.items()}
+
+                # Default quality preset: no shifts, reduced overlap
+                _, kwargs = mock_apply_model.call_args
+                assert kwargs["shifts"] == 0
+                assert kwargs["overlap"] == 0.15
+                # Forward pass runs without autograd bookkeeping
+                assert inference_modes == [True]
+
+    def test_separate_resamples_48k_input(self, test_audio_48k):
+        """Test that non-44.1 kHz input is resampled before apply_model"""
+        separator = MusicSeparator(model_name="htdemucs_6s")
+        mock_model = MagicMock()
+        mock_model.samplerate = 44100
+        separator.model = mock_model
+        
+        with patch('src.separator.apply_model') as mock_apply_model:
+            mock_apply_model.return_value = torch.zeros(1, 6, 2, 44100)
+            separator.separate_to_memory(str(test_audio_48k))
+            
+            # 1s @ 48 kHz in → 1s @ 44.1 kHz handed to the model
+            wav = mock_apply_model.call_args[0][1]
+            assert tuple(wav.shape) == (1, 2, 44100)
+
+    def test_separate_mono_input(self, mono_audio):
+        """Test that mono input reaches the model as stereo and stems are stereo"""
+        separator = MusicSeparator(model_name="htdemucs_6s")
+        mock_model = MagicMock()
+        mock_model.samplerate = 44100
+        separator.model = mock_model
+
+        with patch('src.separator.apply_model') as mock_apply_model:
+            # Built in inference mode, like real apply_model output under _forward
+            with torch.inference_mode():
+                mock_apply_model.return_value = torch.zeros(1, 6, 2, 44100)
+            results = separator.separate_to_memory(str(mono_audio))
+
+            wav = mock_apply_model.call_args[0][1]
+            assert tuple(wav.shape) == (1, 2, 44100)
+            # In-memory stems: no encode/decode round-trip to check the layout
+            assert list(results) == list(separator.stems)
+            for stem, sr in results.values():
+                assert stem.shape[0] == 2
+                assert sr == 44100
+            # Stems are regular tensors: editable in place outside inference_mode
+            vocals, _ = results["vocals"]
+            vocals *= 0.5
+
+    def test_separate_batch_single_forward(self, test_audio, test_audio_48k, mono_audio):
+        """Test that a batch runs one forward pass and is split back per input"""
+        separator = MusicSeparator(model_name="htdemucs_ft")
+        mock_model = MagicMock()
+        mock_model.samplerate = 44100
+        separator.model = mock_model
+
+        with patch('src.separator.apply_model') as mock_apply_model:
+            mock_apply_model.side_effect = lambda model, batch, **kwargs: torch.zeros(
+                batch.shape[0], 4, 2, batch.shape[-1]
+            )
+            results = separator.separate_batch([str(test_audio), str(test_audio_48k), str(mono_audio)])
+
+            mock_apply_model.assert_called_once()
+            assert tuple(mock_apply_model.call_args[0][1].shape) == (3, 2, 44100)
+            assert len(results) == 3
+            for stems in results:
+                assert list(stems) == list(separator.stems)
+                for stem, sr in stems.values():
+                    assert tuple(stem.shape) == (2, 44100)
+                    assert sr == 44100
+                    # Own storage (not a view on the batch output), editable in place
+                    assert stem.untyped_storage().nbytes() == stem.nelement() * stem.element_size()
+                    stem *= 0.5
+
+    def test_separate_invalid_quality(self, test_audio, tmp_path, cached_separator):
+        """Test separation with unknown quality preset"""
+        separator = cached_separator
+        with pytest.raises(ValueError):
+            separator.separate(str(test_audio), str(tmp_path / "output"), quality="ultra")
 
 
 class TestModelCache:
@@ -121,6 +295,17 @@ class TestModelCache:
         separator3 = get_separator("htdemucs_6s")
         assert separator1 is not separator3
 
+    def test_get_separator_evicts_least_recently_used(self):
+        """Test that only the most recently used models stay cached"""
+        clear_cache()
+        with patch('src.separator._MAX_LOADED_MODELS', 1):
+            separator_6s = get_separator("htdemucs_6s")
+            get_separator("htdemucs_ft")
+            
+            # Evicted but still referenced here: reused instead of rebuilt
+            assert get_separator("htdemucs_6s") is separator_6s
+        clear_cache()
+
     def test_clear_cache(self):
         """Test clear_cache function"""
         # Load a model
@@ -146,13 +331,24 @@ class TestSeparatorIntegration:
         assert "names" in models[model_name]  # Fixed: changed from "stems" to "names"
         assert "description" in models[model_name]
 
+    def test_available_models_read_only(self):
+        """Test that nested model entries can't be edited through the shared views"""
+        models = MusicSeparator.get_available_models()
+        with pytest.raises(TypeError):
+            models["htdemucs_6s"]["description"] = "changed"
+        with pytest.raises(TypeError):
+            MusicSeparator.get_model_info("htdemucs_6s")["description"] = "changed"
+        assert MusicSeparator.get_model_info("htdemucs_6s") is models["htdemucs_6s"]
+        assert models["htdemucs_6s"]["description"] == STEM_CONFIGS["htdemucs_6s"]["desc"]
+
 
 class TestSeparatorErrorHandling:
     """Test error handling in separator"""
 
-    def test_separate_file_not_found(self, tmp_path):
+    @pytest.mark.slow
+    def test_separate_file_not_found(self, tmp_path, cached_separator):
         """Test separation with non-existent file"""
-        separator = MusicSeparator(model_name="htdemucs_6s")
+        separator = cached_separator
         with pytest.raises(Exception):
             separator.separate("/non/existent/file.wav", str(tmp_path))
 
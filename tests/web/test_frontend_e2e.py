@@ -1,13 +1,29 @@
 
 import pytest
 from playwright.sync_api import Page, expect
+import numpy as np
+import soundfile as sf
 import os
 import time
 
 # Default to local Vite dev server, can be overridden
 FRONTEND_URL = os.environ.get("FRONTEND_URL", "http://localhost:5173")
-# Short, copyright-free or permissive audio for testing
-TEST_YOUTUBE_URL = "https://www.youtube.com/watch?v=BaW_jenozKc" # "youtube-dl test video"
+# Set to a real URL (e.g. https://www.youtube.com/watch?v=BaW_jenozKc) to exercise yt-dlp.
+# Unset: a local 5s clip is sent as a file:// URL (backend needs ALLOW_LOCAL_MEDIA_URLS=1)
+TEST_YOUTUBE_URL = os.environ.get("TEST_YOUTUBE_URL")
+
+
+@pytest.fixture(scope="module")
+def youtube_url(tmp_path_factory):
+    """URL typed into the YouTube field: TEST_YOUTUBE_URL or a local 5s clip"""
+    if TEST_YOUTUBE_URL:
+        return TEST_YOUTUBE_URL
+    sr = 44100
+    t = np.arange(sr * 5, dtype=np.float32) / sr
+    tone = (0.2 * np.sin(2 * np.pi * 440 * t)).astype(np.float32)
+    clip = tmp_path_factory.mktemp("e2e") / "clip.wav"
+    sf.write(str(clip), np.stack([tone, tone], axis=1), sr, subtype='PCM_16')
+    return clip.as_uri()
 
 def test_load_homepage(page: Page):
     """Verify the app loads and shows the main title."""
@@ -25,7 +41,8 @@ def test_load_homepage(page: Page):
         page.screenshot(path="tests/web/homepage_failure.png")
         raise
 
-def test_youtube_separation_flow(page: Page):
+@pytest.mark.slow
+def test_youtube_separation_flow(page: Page, youtube_url):
     """
     Full E2E test:
     1. Switch to YouTube mode
@@ -44,21 +61,25 @@ def test_youtube_separation_flow(page: Page):
         
         # 2. Enter URL
         input_field = page.get_by_placeholder("https://youtube.com/watch?v=...")
-        input_field.fill(TEST_YOUTUBE_URL)
+        input_field.fill(youtube_url)
         
         # 3. Click Separate
         separate_btn = page.get_by_role("button", name="Start Separation")
         expect(separate_btn).to_be_enabled()
-        separate_btn.click()
-        
-        # 4. Wait for Processing state
-        print("Waiting for processing to start...")
-        expect(page.get_by_role("button", name="Processing...")).to_be_visible(timeout=10000)
-        
-        # 5. Wait for Done state
+
+        # 4-5. The frontend logs SEPARATION_DONE/SEPARATION_ERROR once stems are
+        # loaded (or the job fails): wait on that event instead of polling the DOM
         print("Waiting for separation to complete (this may take a minute)...")
+        with page.expect_console_message(
+            lambda m: m.text.startswith(("SEPARATION_DONE:", "SEPARATION_ERROR:")),
+            timeout=300000,
+        ) as done_message:
+            separate_btn.click()
+            expect(page.get_by_role("button", name="Processing...")).to_be_visible(timeout=10000)
+        assert done_message.value.text.startswith("SEPARATION_DONE:"), done_message.value.text
+
         # We expect at least one stem to appear (e.g., "vocals")
-        expect(page.get_by_text("vocals")).to_be_visible(timeout=300000)
+        expect(page.get_by_text("vocals")).to_be_visible()
 
         print("✅ Separation complete! Stems found.")
         
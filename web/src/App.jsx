@@ -129,6 +129,7 @@ function AppContent() {
           handleJobSuccess(data);
         } else if (data.status === 'error') {
           console.error("[Polling] Job Error:", data.error);
+          console.log(`SEPARATION_ERROR:${jobId}`); // Signal for E2E tests
           clearInterval(pollInterval);
           setStatus('error');
           setErrorMsg(data.error || "Processing failed on server.");
@@ -206,9 +207,11 @@ function AppContent() {
       // Update UI only when ALL stems are ready
       setStems(loadedStems);
       setStatus('done');
+      console.log(`SEPARATION_DONE:${data.session_id}`); // Signal for E2E tests
 
     } catch (e) {
       console.error("Failed to load stems", e);
+      console.log(`SEPARATION_ERROR:${data.session_id}`);
       setErrorMsg("Failed to download separated stems.");
       setStatus('error');
     }
@@ -260,6 +263,7 @@ function AppContent() {
       setJobId(res.data.job_id);
     } catch (e) {
       console.error("YouTube failed", e);
+      console.log("SEPARATION_ERROR:youtube");
       setStatus('error');
       setErrorMsg(e.response?.data?.detail || "YouTube processing failed.");
     }